@@ -1,9 +1,18 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
+import hashlib
 import json
+import os
 
 import numpy as np
 import pandas as pd
-import re
+
+try:
+    import numba
+except ImportError:
+    # numba is optional; the scan kernel below then runs as plain Python
+    numba = None
 
 
 #
@@ -121,29 +130,34 @@ CATEGORY_ORDER = {
 }
 
 
+def strip_strings(series):
+    """Strip whitespace from a string Series, returning an object array
+
+    A plain list comprehension over the underlying array is faster than the
+    pandas ``.str.strip`` accessor, which adds per-element NA handling.
+    """
+    return np.asarray([s.strip() for s in series.to_numpy()], dtype=object)
+
+
+@lru_cache(maxsize=None)
 def left_pad_code(code):
     """Left-pad the leading numerical part of a code with zeros to 3 digits"""
     code = code.lstrip("0")
-    i_str = re.search("^[0-9]+", code).group()
-    i = int(i_str)
-    assert 0 < i <= 999
-    return f"{int(i_str):03d}{code[len(i_str):]}"
+    n_digits = 0
+    while n_digits < len(code) and code[n_digits].isdigit():
+        n_digits += 1
+    assert 0 < int(code[:n_digits]) <= 999
+    return code[:n_digits].zfill(3) + code[n_digits:]
 
 
-def map_icd_codes_to_categories(df, icd_version):
-    """Append a column 'category' to df containing disease categories"""
-    # default label
-    df["category"] = OTHER_LABEL
-
-    # From ICD6 on we have numerical-only four-digit codes, categorization works
-    # on 3-digit codes only. Drop the last digit before left-padding.
-    if icd_version >= 6:
-        lp_code_map = {c: c[:-1] for c in df["code"].unique()}
-    else:
-        # Generate left-padded codes for lexsorted selection in table.
-        lp_code_map = {c: left_pad_code(c) for c in df["code"].unique()}
-    df["lp_code"] = df["code"].map(lp_code_map)
+@lru_cache(maxsize=None)
+def icd_category_ranges(icd_version):
+    """Parsed (category, start_code, end_code) tuples for an ICD version
 
+    The range tables are constants, so parse them once per ICD version and
+    reuse the result across files and years.
+    """
+    ranges = []
     for category, mappings in ICD_CATEGORIES.items():
         codes = mappings[f"ICD-{icd_version}"]
         for code in [c.strip().strip(",") for c in codes.split()]:
@@ -151,123 +165,305 @@ def map_icd_codes_to_categories(df, icd_version):
                 start_code, end_code = code.split("-")
             else:
                 start_code = end_code = code
+            ranges.append((category, start_code, end_code))
+    return tuple(ranges)
+
+
+def scan_code_intervals(codes, range_starts, range_ends, range_cats, out):
+    """Write a category index into out for each code hit by an integer range
+
+    Codes outside all ranges keep their initial index. Returns the number of
+    conflicting assignments, i.e. codes hit by ranges of different categories.
+    JIT-compiled below if numba is available.
+    """
+    n_conflicts = 0
+    for i in range(codes.size):
+        for j in range(range_starts.size):
+            if range_starts[j] <= codes[i] and codes[i] <= range_ends[j]:
+                if out[i] >= 0 and out[i] != range_cats[j]:
+                    n_conflicts += 1
+                out[i] = range_cats[j]
+    return n_conflicts
+
+
+if numba is not None:
+    scan_code_intervals = numba.njit(cache=True)(scan_code_intervals)
+
+
+def map_icd_codes_to_categories(df, icd_version):
+    """Append a column 'category' to df containing disease categories
+
+    Categories are resolved on the unique codes only and then mapped onto the rows,
+    so the per-range work is independent of the number of data rows.
+    """
+    unique_codes = df["code"].unique()
+    category_names = list(ICD_CATEGORIES)
+
+    if icd_version >= 6:
+        # From ICD6 on we have numerical-only four-digit codes, categorization
+        # works on 3-digit codes only: drop the last digit and scan integer
+        # intervals in a tight (optionally JIT-compiled) loop
+        lp_codes = np.array(
+            [int(c[:-1]) if c[:-1].isdigit() else -1 for c in unique_codes],
+            dtype=np.int64,
+        )
+        # ranges are purely numeric here; anything that isn't (e.g. the stray
+        # '444.2' in ICD-8) matches no 3-digit code, as before
+        ranges = [
+            (category_names.index(category), int(start_code), int(end_code))
+            for category, start_code, end_code in icd_category_ranges(icd_version)
+            if start_code.isdigit() and end_code.isdigit()
+        ]
+        cat_indices = np.full(lp_codes.size, -1, dtype=np.int64)
+        n_conflicts = scan_code_intervals(
+            lp_codes,
+            np.array([r[1] for r in ranges], dtype=np.int64),
+            np.array([r[2] for r in ranges], dtype=np.int64),
+            np.array([r[0] for r in ranges], dtype=np.int64),
+            cat_indices,
+        )
+        # make sure there are no category overlaps
+        assert n_conflicts == 0
+        code_to_category = {
+            c: category_names[i] if i >= 0 else OTHER_LABEL
+            for c, i in zip(unique_codes, cat_indices)
+        }
+    else:
+        # Earlier revisions have letter suffixes ('44b', ...), so compare
+        # left-padded codes lexicographically. Pad all unique codes in one
+        # vectorized extract/zfill pass rather than per-code Python calls.
+        code_parts = (
+            pd.Series(unique_codes).str.lstrip("0").str.extract(r"^(\d+)(.*)$")
+        )
+        assert not code_parts[0].isnull().any()
+        lp_codes = (code_parts[0].str.zfill(3) + code_parts[1]).to_numpy()
+
+        # sort once, then each range below is two binary searches instead of
+        # two full-array comparisons
+        order = np.argsort(lp_codes)
+        sorted_lp_codes = lp_codes[order]
+        sorted_codes = unique_codes[order]
+
+        # default label
+        code_to_category = {c: OTHER_LABEL for c in unique_codes}
+
+        for category, start_code, end_code in icd_category_ranges(icd_version):
+            range_start = left_pad_code(start_code)
+            range_end = left_pad_code(end_code) + "z"
+
+            sel_start = np.searchsorted(sorted_lp_codes, range_start, side="left")
+            sel_stop = np.searchsorted(sorted_lp_codes, range_end, side="right")
 
             # make sure there are no category overlaps
-            row_sel = (df["lp_code"] >= left_pad_code(start_code)) & (
-                df["lp_code"] <= left_pad_code(end_code) + "z"
-            )
-            assert (df.loc[row_sel, "category"].isin([OTHER_LABEL, category])).all()
+            for c in sorted_codes[sel_start:sel_stop]:
+                assert code_to_category[c] in (OTHER_LABEL, category)
+                code_to_category[c] = category
 
-            # set category
-            df.loc[
-                row_sel,
-                "category",
-            ] = category
+    df["category"] = df["code"].map(code_to_category)
 
 
-def load_20th_century():
-    """Load/process data from 20th century"""
+def write_csv(df, path):
+    """Write a DataFrame to CSV without the index
+
+    Routes through pyarrow's vectorized native CSV writer if it is installed,
+    which is much faster than the pandas writer for large frames.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        df.to_csv(path, index=False)
+        return
+    pa_csv.write_csv(pa.Table.from_pandas(df, preserve_index=False), str(path))
+
+
+def open_workbook(path):
+    """Open an Excel workbook for parsing, preferring the fast calamine engine
+
+    ``pd.ExcelFile`` parses the workbook container once, so repeated ``parse`` calls
+    don't re-read the file. The Rust-based calamine engine is much faster than the
+    default xlrd/openpyxl engines; fall back to those if it is not installed.
+    """
+    try:
+        return pd.ExcelFile(path, engine="calamine")
+    except ImportError:
+        return pd.ExcelFile(path)
+
+
+# cache for processed description tables, keyed by sheet content; the three
+# ICD-9 workbooks share a single description table
+description_cache = {}
 
-    # container for processed data files, for output
+
+def parse_descriptions(xl):
+    """Parse the 'description' sheet of a workbook into a code -> desc Series
+
+    Sheets that were already seen (keyed by a hash of their raw content) are
+    only processed once per worker process.
+    """
+    descriptions = xl.parse(
+        sheet_name="description",
+        skiprows=1,
+        usecols="A:C",
+        names=["code", "desc1", "desc2"],
+        dtype=str,
+    ).fillna("")
+
+    sheet_hash = hashlib.blake2b(
+        "\x1e".join(map(str, descriptions.to_numpy().ravel())).encode()
+    ).hexdigest()
+    if sheet_hash in description_cache:
+        return description_cache[sheet_hash]
+
+    # Descriptions are split across two columns. Either the value in both columns is identical
+    # or the second column specifies the first more precisely. Join or drop second value.
+    desc1 = strip_strings(descriptions["desc1"])
+    desc2 = strip_strings(descriptions["desc2"])
+    descriptions["desc"] = np.where(
+        (desc1 == desc2) | (desc2 == ""), desc1, desc1 + ", " + desc2
+    )
+    descriptions["code"] = strip_strings(descriptions["code"])
+    descriptions = descriptions.set_index("code")["desc"]
+
+    # de-duplicate codes, so that mapping descriptions onto the data hits the
+    # fast unique-index path instead of falling back to a slow lookup
+    descriptions = descriptions.groupby(level=0, sort=False).first()
+    assert descriptions.index.is_unique
+
+    description_cache[sheet_hash] = descriptions
+    return descriptions
+
+
+def process_file_20th_century(file_name):
+    """Load/process a single 20th-century data file, return aggregated data
+
+    The aggregated result is cached as Parquet in the output directory; re-runs
+    load the cache instead of re-parsing the workbook as long as the raw file
+    is unchanged.
+    """
+    raw_path = raw_data_dir / file_name
+    cache_path = output_dir / f"{file_name}.parquet"
+    if cache_path.exists() and cache_path.stat().st_mtime >= raw_path.stat().st_mtime:
+        return pd.read_parquet(cache_path)
+
+    print(file_name)
+
+    # container for processed per-year data, for output
     out = []
 
-    for file_name in file_names_20th_century:
-        print(file_name)
+    xl = open_workbook(raw_path)
+
+    descriptions = parse_descriptions(xl)
 
-        xl = pd.ExcelFile(raw_data_dir / file_name)
+    # file name ends in ICD version number, plus 'a', 'b' or 'c' for ICD9
+    icd_version = file_name.split(".")[0][-1]
+    if not icd_version.isdigit():
+        icd_version = file_name.split(".")[0][-2]
+    assert icd_version.isdigit()
+    icd_version = int(icd_version)
+    assert 2 <= icd_version <= 9
 
-        descriptions = xl.parse(
-            sheet_name="description",
+    # data sheets are called icdN_1, icdN_2, ... parse them all in one call,
+    # which decodes the workbook once and returns a dict of DataFrames
+    data_sheet_names = [s for s in xl.sheet_names if s.startswith(f"icd{icd_version}")]
+    assert len(data_sheet_names) >= 2
+
+    sheet_data = list(
+        xl.parse(
+            sheet_name=data_sheet_names,
             skiprows=1,
-            usecols="A:C",
-            names=["code", "desc1", "desc2"],
-            dtype=str,
-        ).fillna("")
-
-        # Descriptions are split across two columns. Either the value in both columns is identical
-        # or the second column specifies the first more precisely. Join or drop second value.
-        descriptions["desc1"] = descriptions["desc1"].str.strip()
-        descriptions["desc2"] = descriptions["desc2"].str.strip()
-        descriptions["desc"] = descriptions.apply(
-            lambda s: s["desc1"]
-            if s["desc1"] == s["desc2"] or len(s["desc2"]) == 0
-            else s["desc1"] + ", " + s["desc2"],
-            axis=1,
+            names=["code", "year", "sex", "age", "n"],
+            # narrow integer types halve the memory traffic of the groupby
+            # sums downstream; death counts fit easily into int32
+            dtype={"code": str, "year": "int16", "n": "int32"},
+        ).values()
+    )
+
+    df_all_years = pd.concat(sheet_data, ignore_index=True, copy=False)
+
+    # map in metadata once per file: descriptions and categories only depend
+    # on the code and the ICD version, not on the year;
+    # strip each distinct code once rather than every row
+    df_all_years["code"] = df_all_years["code"].map(
+        {c: c.strip() for c in df_all_years["code"].unique()}
+    )
+    df_all_years["desc"] = df_all_years["code"].map(descriptions).fillna("Other")
+    map_icd_codes_to_categories(df_all_years, icd_version)
+
+    # dictionary-encode low-cardinality text columns, so that grouping and
+    # comparisons work on small integer codes instead of Python strings
+    df_all_years["code"] = df_all_years["code"].astype("category")
+    df_all_years["sex"] = df_all_years["sex"].astype("category")
+    df_all_years["category"] = df_all_years["category"].astype("category")
+
+    # keep only desired years: filter once up front, then groupby partitions
+    # the remaining frame in a single pass
+    df_all_years = df_all_years[df_all_years["year"].isin(years)]
+    for year, df in df_all_years.groupby("year", sort=False):
+        assert (df["desc"] == "Other").sum() / len(df) < 0.05
+        assert (df["category"] == OTHER_LABEL).sum() / len(df) < 0.35
+
+        # keep only top N codes by number of deaths (across all age groups);
+        # nlargest does a partial sort instead of sorting all code sums
+        kept_codes = frozenset(
+            df.groupby("code", sort=False, observed=True)["n"]
+            .sum()
+            .nlargest(top_n_codes)
+            .index
         )
-        descriptions["code"] = descriptions["code"].str.strip()
-        descriptions = descriptions.set_index("code")["desc"]
-
-        # file name ends in ICD version number, plus 'a', 'b' or 'c' for ICD9
-        icd_version = file_name.split(".")[0][-1]
-        if not icd_version.isdigit():
-            icd_version = file_name.split(".")[0][-2]
-        assert icd_version.isdigit()
-        icd_version = int(icd_version)
-        assert 2 <= icd_version <= 9
-
-        # data sheets are called icdN_1, icdN_2, ... concatenate them all
-        sheet_data = []
-        for sheet_name in [
-            s for s in xl.sheet_names if s.startswith(f"icd{icd_version}")
-        ]:
-            sheet_data.append(
-                xl.parse(
-                    sheet_name=sheet_name,
-                    skiprows=1,
-                    names=["code", "year", "sex", "age", "n"],
-                    dtype={"code": str},
-                )
-            )
 
-        assert len(sheet_data) >= 2
-
-        df_all_years = pd.concat(sheet_data)
-
-        # keep only desired years
-        for year in df_all_years["year"].unique():
-            if year not in years:
-                continue
-
-            # select data, map in metadata
-            df = df_all_years[df_all_years["year"] == year].copy()
-            df["code"] = df["code"].str.strip()
-            df["desc"] = df["code"].map(descriptions).fillna("Other")
-            assert (df["desc"] == "Other").sum() / len(df) < 0.05
-            map_icd_codes_to_categories(df, icd_version)
-            assert (df["category"] == OTHER_LABEL).sum() / len(df) < 0.35
-
-            # keep only top N codes by number of deaths (across all age groups)
-            kept_codes = (
-                df.groupby("code")["n"]
-                .sum()
-                .sort_values(ascending=False)
-                .iloc[:top_n_codes]
-                .index.values
+        # map descriptions of other codes to category + ", other"; desc and
+        # category are both functions of the code, so build the new desc per
+        # unique code and broadcast it with a single map
+        code_meta = df[["code", "desc", "category"]].drop_duplicates("code")
+        desc_per_code = {
+            c: d if c in kept_codes else cat + ", other"
+            for c, d, cat in zip(
+                code_meta["code"], code_meta["desc"], code_meta["category"]
             )
+        }
+        df["desc"] = df["code"].map(desc_per_code)
+
+        # re-bucket ages in a single pass over the unique age strings:
+        # 80-84 and 85+ aggregate to 80+ (early data has only 80+), and ages
+        # 10-79 aggregate to 10-year instead of 5-year groups
+        def age_bucket(a):
+            if a.startswith("8"):
+                return "80+"
+            if a[0] in "1234567":
+                return f"{a[0]}0-{a[0]}9"
+            return a
+
+        df["age"] = df["age"].map({a: age_bucket(a) for a in df["age"].unique()})
+
+        # aggregate by description age group and sex to reduce data size
+        df["age"] = df["age"].astype("category")
+        df_agg = (
+            df.groupby(["year", "age", "category", "desc"], sort=False, observed=True)["n"]
+            .sum()
+            .reset_index()
+        )
 
-            # map descriptions of other codes to category + ", other"
-            has_kept_code = df["code"].isin(kept_codes)
-            df.loc[~has_kept_code, "desc"] = (
-                df.loc[~has_kept_code, "category"] + ", other"
-            )
+        # done with this chunk
+        out.append(df_agg)
 
-            # aggregate to 80+ age group (early data has only 80+, later data has 80-84 and 85+),
-            # aggregation is done in next line
-            df.loc[df["age"].str.startswith("8"), "age"] = "80+"
+    # concatenate per-year output data, cache for future runs
+    df_file = pd.concat(out, ignore_index=True)
+    df_file.to_parquet(cache_path, compression="zstd")
+    return df_file
 
-            # for ages > 10, aggregate to 10-year age groups instead of 5-year groups
-            for decade in range(1, 8):
-                df.loc[
-                    df["age"].str.startswith(str(decade)), "age"
-                ] = f"{decade * 10}-{decade*10 + 9}"
 
-            # aggregate by description age group and sex to reduce data size
-            df_agg = (
-                df.groupby(["year", "age", "category", "desc"])["n"].sum().reset_index()
-            )
+def load_20th_century():
+    """Load/process data from 20th century
 
-            # done with this chunk
-            out.append(df_agg)
+    The data files are independent of each other, so they are processed in
+    parallel worker processes; only the small aggregated frames travel back
+    to the parent process.
+    """
+    with ProcessPoolExecutor(
+        max_workers=min(len(file_names_20th_century), os.cpu_count())
+    ) as executor:
+        out = list(executor.map(process_file_20th_century, file_names_20th_century))
 
     # concatenate all output data
     return pd.concat(out, ignore_index=True)
@@ -295,54 +491,80 @@ def data_to_tree(df):
     # container for metadata JSON
     meta = dict(years=sorted([int(i) for i in df["year"].unique()]))
 
-    # sort age groups, then rename to strip leading zeros
-    df.loc[df["age"] == "<1", "age"] = "00-01"
+    # dictionary-encode the text columns (lost when reading back from CSV), so
+    # the groupbys and maps below work on integer codes instead of strings
+    df["category"] = df["category"].astype("category")
+    df["desc"] = df["desc"].astype("category")
+
+    # sort age groups, then rename to strip leading zeros; go through plain
+    # strings before re-encoding, so the category order is rebuilt
+    # lexicographically (the order carried over from the loader puts "<1"
+    # after "80+", and map alone would keep it)
+    df["age"] = (
+        df["age"]
+        .astype(object)
+        .map({a: "00-01" if a == "<1" else a for a in df["age"].unique()})
+        .astype("category")
+    )
     ages_sorted = sorted(df["age"].unique())
+
+    # the category order drives all (year, age) sorts below, so it must match
+    # the lexicographic order of the age strings
+    assert list(df["age"].cat.categories) == ages_sorted
     age_map = {
         s: s if s == "80+" else f"{int(s.split('-')[0])}-{int(s.split('-')[1])}"
         for s in ages_sorted
     }
     meta["ages"] = [age_map[s] for s in ages_sorted]
 
-    # map in category order
-    df["catIdx"] = df["category"].map(CATEGORY_ORDER)
-    assert not df["catIdx"].isnull().any()
+    # map in category order: gather from a small int8 lookup table indexed by
+    # the dictionary codes instead of dict-mapping every row
+    cat_dtype = pd.CategoricalDtype(categories=list(CATEGORY_ORDER), ordered=True)
+    df["category"] = df["category"].astype(cat_dtype)
+    cat_codes = df["category"].cat.codes.to_numpy()
+    assert (cat_codes != -1).all()
+    cat_idx_lut = np.array(
+        [CATEGORY_ORDER[c] for c in cat_dtype.categories], dtype=np.int8
+    )
+    df["catIdx"] = cat_idx_lut[cat_codes]
 
     # compute fraction of deaths per year occurring in each age group and code
-    df["frac"] = df.groupby("year", group_keys=False).apply(
-        lambda g: g["n"] / g["n"].sum()
-    )
+    df["frac"] = df["n"] / df.groupby("year", sort=False)["n"].transform("sum")
     assert abs(df["frac"].sum() - len(years)) < 1.0e-9
     df = df.drop(["n"], axis=1)
 
-    # for each age group, add an entry for deaths occurring at older ages
-    df = df.set_index(["year", "age"]).sort_index()
-    older_ages_rows = []
-    for year in years:
-        prev_frac_sum = 1
-        for age in ages_sorted:
-            age_frac_sum = df.loc[(year, age)]["frac"].sum()
-            older_frac = prev_frac_sum - age_frac_sum
-            desc = (
-                f"older than {int(age.split('-')[1])} years"
-                if "-" in age
-                else "Impossible!"  # for 85+
-            )
-            older_ages_rows.append(
-                dict(
-                    year=year,
-                    age=age,
-                    category=desc,
-                    desc=desc,
-                    catIdx=0,
-                    frac=older_frac,
-                )
-            )
-            prev_frac_sum = older_frac
+    # for each age group, add an entry for deaths occurring at older ages: the
+    # older-ages fraction is one minus the running sum of the per-age fraction
+    # totals, computed for all years and ages in one cumulative table operation
+    age_frac_sums = (
+        df.groupby(["year", "age"], sort=False, observed=True)["frac"]
+        .sum()
+        .unstack()[ages_sorted]
+    )
+    older_fracs = (1 - age_frac_sums.cumsum(axis=1)).stack()
+    older_descs = {
+        age: f"older than {int(age.split('-')[1])} years"
+        if "-" in age
+        else "Impossible!"  # for 85+
+        for age in ages_sorted
+    }
+    older_desc_col = [
+        older_descs[a] for a in older_fracs.index.get_level_values("age")
+    ]
+    older_ages_rows = pd.DataFrame(
+        {
+            "year": older_fracs.index.get_level_values("year"),
+            "age": older_fracs.index.get_level_values("age"),
+            "category": older_desc_col,
+            "desc": older_desc_col,
+            "catIdx": 0,
+            "frac": older_fracs.values,
+        }
+    )
 
     # append the additional rows, sort everything
     assert df.isnull().sum().sum() == 0
-    df = pd.concat([df.reset_index(), pd.DataFrame(older_ages_rows)]).sort_values(
+    df = pd.concat([df, older_ages_rows], copy=False).sort_values(
         by=["year", "age", "catIdx"]
     )  # type: pd.DataFrame
     assert df.isnull().sum().sum() == 0
@@ -355,34 +577,43 @@ def data_to_tree(df):
     ).drop(["sort_order"], axis=1)
 
     # compute cumulative fraction per year and age group for horizontal positioning
-    df["cumFrac"] = df.groupby(["year", "age"], group_keys=False)["frac"].apply(
-        lambda g: g.cumsum()
-    )
+    df["cumFrac"] = df.groupby(["year", "age"], sort=False, observed=True)[
+        "frac"
+    ].cumsum()
     assert df["cumFrac"].min() > 1.0e-9
     assert df["cumFrac"].max() < 1 + 1.0e-9
 
-    def align_trunk(g):
-        # shift segments to align properly
-        prev_left_sum = 0
-        frac_sum_per_side = g.groupby([g["age"], np.sign(g["catIdx"])])["frac"].sum()
-        g = g.set_index("age")
-        for a in ages_sorted:
-            g.loc[a, "cumFrac"] += prev_left_sum
-            prev_left_sum += frac_sum_per_side.loc[a, -1]
-
-        # store fractional position of outer edges of branch bundles, after shifting
-        for a in ages_sorted:
-            trunk_row = g.loc[a][g.loc[a, "catIdx"] == 0].iloc[0]
-            g.loc[a, "leftFrac"] = (
-                trunk_row["cumFrac"] - trunk_row["frac"] - frac_sum_per_side.loc[a, -1]
-            )
-            g.loc[a, "rightFrac"] = trunk_row["cumFrac"] + frac_sum_per_side.loc[a, 1]
-
-        return g.reset_index()
-
     # shift cumFrac such that ingoing fraction for each age aligns with the trunk
-    # of the previous age; also store leftFrac and rightFrac
-    df = df.groupby("year", group_keys=False).apply(align_trunk)
+    # of the previous age; the shift for an age is the summed left-side (catIdx < 0)
+    # fraction of all younger ages in the same year, i.e. an exclusive cumulative sum
+    frac_sum_per_side = (
+        df.groupby(["year", "age", np.sign(df["catIdx"])], sort=False, observed=True)[
+            "frac"
+        ]
+        .sum()
+        .unstack(fill_value=0)
+    )
+    shifts = pd.DataFrame(
+        {
+            "left_sum": frac_sum_per_side[-1],
+            "right_sum": frac_sum_per_side[1],
+            "shift": frac_sum_per_side[-1].groupby(level="year", sort=False).cumsum()
+            - frac_sum_per_side[-1],
+        }
+    ).reset_index()
+    df = df.merge(shifts, on=["year", "age"], how="left")
+    df["cumFrac"] += df["shift"]
+
+    # store fractional position of outer edges of branch bundles, after shifting,
+    # computed from the trunk (catIdx == 0) row of each year and age
+    trunk = df[df["catIdx"] == 0].drop_duplicates(["year", "age"])
+    trunk = trunk.assign(
+        leftFrac=trunk["cumFrac"] - trunk["frac"] - trunk["left_sum"],
+        rightFrac=trunk["cumFrac"] + trunk["right_sum"],
+    )
+    df = df.merge(
+        trunk[["year", "age", "leftFrac", "rightFrac"]], on=["year", "age"], how="left"
+    ).drop(["left_sum", "right_sum", "shift"], axis=1)
 
     # this is the disease-level file, map ages to nicer strings before returning
     # (can only do that now because we needed the leading zeros for sorting)
@@ -392,7 +623,7 @@ def data_to_tree(df):
 
     # aggregate on the category level
     cat = (
-        df.groupby(["year", "age", "category"])
+        df.groupby(["year", "age", "category"], observed=True)
         .agg(
             {
                 "frac": "sum",
@@ -410,24 +641,26 @@ def data_to_tree(df):
 
     # categories in the correct order
     meta["categories"] = list(
-        cat.groupby("catIdx")["category"].first().sort_index().values
+        cat.groupby("catIdx", sort=False)["category"].first().sort_index().values
     )
 
     return dis, cat, meta
 
 
 if __name__ == "__main__":
-    # convert data to CSV table, if it doesn't exist yet
+    # convert data to CSV table plus a Parquet twin, if not done yet; the CSV
+    # is the published end product, the Parquet file preserves the dtypes
+    # (including categoricals) and reads back much faster
     all_data_csv = output_dir / "Deaths_ENW_1915-2015.csv"
-    if not all_data_csv.exists():
+    all_data_parquet = output_dir / "Deaths_ENW_1915-2015.parquet"
+    if not all_data_parquet.exists():
         df20 = load_20th_century()
-        df20.to_csv(all_data_csv, index=False)
+        write_csv(df20, all_data_csv)
+        df20.to_parquet(all_data_parquet, compression="zstd")
 
     # process into tree definitions
-    df20 = pd.read_csv(all_data_csv)
+    df20 = pd.read_parquet(all_data_parquet)
     diseases, categories, metadata = data_to_tree(df20)
-    diseases.to_csv(output_dir / "Deaths_ENW_1915-2015_disease_tree.csv", index=False)
-    categories.to_csv(
-        output_dir / "Deaths_ENW_1915-2015_category_tree.csv", index=False
-    )
+    write_csv(diseases, output_dir / "Deaths_ENW_1915-2015_disease_tree.csv")
+    write_csv(categories, output_dir / "Deaths_ENW_1915-2015_category_tree.csv")
     json.dump(metadata, (output_dir / "Deaths_ENW_1915-2015_tree_meta.json").open("w"))